@@ -0,0 +1,93 @@
+"""
+Tinymovr CAN Channel Tests
+Copyright Ioannis Chatzikonstantinou 2020-2023
+
+Tests frame reception of the CAN channel without hardware.
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import unittest
+from threading import Timer
+from unittest.mock import patch
+
+import can
+
+from tinymovr.channel import CANChannel, ResponseError, arbitration_from_ids
+
+
+class TestCANChannelRecv(unittest.TestCase):
+
+    def setUp(self):
+        with patch("tinymovr.channel.get_router"):
+            self.channel = CANChannel(node_id=1)
+
+    def _frame(self, ep_id, data):
+        return can.Message(
+            arbitration_id=arbitration_from_ids(ep_id, 0, 1),
+            is_extended_id=True,
+            data=data,
+        )
+
+    def _feed_later(self, delay, frame):
+        timer = Timer(delay, self.channel._recv_cb, args=(frame,))
+        timer.start()
+        self.addCleanup(timer.join)
+
+    def test_queued_frames_returned_without_wait(self):
+        """
+        Frames already in the queue are returned immediately, even after
+        the first recv has cleared the receive event.
+        """
+        self.channel._recv_cb(self._frame(5, b"\x01"))
+        self.channel._recv_cb(self._frame(5, b"\x02"))
+        start = time.monotonic()
+        self.assertEqual(self.channel.recv(5, timeout=1.0), b"\x01")
+        self.assertEqual(self.channel.recv(5, timeout=1.0), b"\x02")
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_non_matching_frame_does_not_end_wait(self):
+        """
+        A frame for another endpoint wakes the channel but recv keeps
+        waiting for the matching one.
+        """
+        self._feed_later(0.05, self._frame(6, b"\x06"))
+        self._feed_later(0.2, self._frame(5, b"\x05"))
+        start = time.monotonic()
+        self.assertEqual(self.channel.recv(5, timeout=1.0), b"\x05")
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        self.assertEqual(len(self.channel.queue), 1)
+
+    def test_non_matching_frame_does_not_raise_early(self):
+        """
+        A frame for another endpoint does not make recv give up before
+        its timeout.
+        """
+        self._feed_later(0.05, self._frame(6, b"\x06"))
+        start = time.monotonic()
+        with self.assertRaises(ResponseError):
+            self.channel.recv(5, timeout=0.3)
+        self.assertGreaterEqual(time.monotonic() - start, 0.25)
+
+    def test_timeout_raises(self):
+        """
+        With no frames received, recv raises ResponseError once the
+        timeout elapses.
+        """
+        start = time.monotonic()
+        with self.assertRaises(ResponseError):
+            self.channel.recv(5, timeout=0.1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+if __name__ == "__main__":
+    unittest.main()
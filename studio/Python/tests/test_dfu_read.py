@@ -0,0 +1,201 @@
+"""
+Tinymovr DFU Flash Read Tests
+Copyright Ioannis Chatzikonstantinou 2020-2023
+
+Tests pipelined flash reads of the DFU module against a simulated device.
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import struct
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from tinymovr.channel import ResponseError
+from tinymovr.dfu import (
+    FLASH_START_ADDR,
+    READ_BLOCK_WORDS,
+    iter_flash_words,
+    compare_bin_w_device,
+    calculate_local_checksum,
+)
+
+
+class FakeSerializer:
+    """Passes the address through as the request payload."""
+
+    def serialize(self, values, *dtypes):
+        return values[0]
+
+    def deserialize(self, data, *dtypes):
+        return [data]
+
+
+class FakeChannel:
+    """
+    Replies to read requests from a flash dict, in order. Requests for
+    addresses in drop get no reply, once.
+    """
+
+    def __init__(self, flash, drop=()):
+        self.flash = flash
+        self.drop = set(drop)
+        self.serializer = FakeSerializer()
+        self.queue = []
+        self.sent = 0
+        self.received = 0
+        self.max_in_flight = 0
+        self.timeouts = 0
+
+    def send(self, addr, ep_id):
+        self.sent += 1
+        self.max_in_flight = max(self.max_in_flight, self.sent - self.received)
+        if addr in self.drop:
+            self.drop.discard(addr)
+        else:
+            self.queue.append(self.flash[addr])
+
+    def recv(self, ep_id):
+        if not self.queue:
+            self.timeouts += 1
+            raise ResponseError(1)
+        self.received += 1
+        return self.queue.pop(0)
+
+
+class FakeReadFlash:
+    """Stands in for the read_flash_32 remote function."""
+
+    ep_id = 1
+    dtype = None
+    arguments = [SimpleNamespace(dtype=None)]
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.calls = 0
+
+    def __call__(self, addr):
+        self.calls += 1
+        return self.channel.flash[addr]
+
+
+class TestIterFlashWords(unittest.TestCase):
+
+    def setUp(self):
+        self.n_words = 37
+        self.flash = {
+            FLASH_START_ADDR + i * 4: 0x1000 + i for i in range(self.n_words)
+        }
+
+    def _device(self, **kwargs):
+        channel = FakeChannel(self.flash, **kwargs)
+        return SimpleNamespace(read_flash_32=FakeReadFlash(channel)), channel
+
+    def test_reply_order(self):
+        """
+        Pipelined replies are yielded in address order, without any
+        sequential reads.
+        """
+        device, channel = self._device()
+        words = list(iter_flash_words(device, FLASH_START_ADDR, self.n_words))
+        self.assertEqual(words, [0x1000 + i for i in range(self.n_words)])
+        self.assertEqual(device.read_flash_32.calls, 0)
+
+    def test_requests_in_flight_bounded(self):
+        """
+        No more than READ_BLOCK_WORDS requests are outstanding at a time.
+        """
+        device, channel = self._device()
+        list(iter_flash_words(device, FLASH_START_ADDR, self.n_words))
+        self.assertLessEqual(channel.max_in_flight, READ_BLOCK_WORDS)
+
+    def test_queue_empty_after_early_close(self):
+        """
+        Closing the reader early sends no further requests and leaves no
+        replies in the channel queue.
+        """
+        device, channel = self._device()
+        words = iter_flash_words(device, FLASH_START_ADDR, self.n_words)
+        next(words)
+        next(words)
+        words.close()
+        self.assertEqual(channel.queue, [])
+        self.assertEqual(channel.sent, READ_BLOCK_WORDS)
+
+    def test_dropped_request_falls_back_to_sequential(self):
+        """
+        A dropped request makes the failed window and the rest of the
+        words be read sequentially, with correct values.
+        """
+        dropped = FLASH_START_ADDR + (READ_BLOCK_WORDS + 1) * 4
+        device, channel = self._device(drop=[dropped])
+        words = list(iter_flash_words(device, FLASH_START_ADDR, self.n_words))
+        self.assertEqual(words, [0x1000 + i for i in range(self.n_words)])
+        self.assertEqual(channel.queue, [])
+        self.assertEqual(
+            device.read_flash_32.calls, self.n_words - READ_BLOCK_WORDS
+        )
+        # Only the missing reply times out, there is no drain after it
+        self.assertEqual(channel.timeouts, 1)
+
+
+class TestCompareBin(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.bin_path = tempfile.mkstemp(suffix=".bin")
+        self.addCleanup(os.remove, self.bin_path)
+        self.words = [0x2000 + i for i in range(32)]
+        with os.fdopen(fd, "wb") as bin_file:
+            bin_file.write(struct.pack("<32I", *self.words))
+        self.flash = {
+            FLASH_START_ADDR + i * 4: w for i, w in enumerate(self.words)
+        }
+
+    def test_match(self):
+        """
+        A device holding the .bin image compares equal.
+        """
+        channel = FakeChannel(self.flash)
+        device = SimpleNamespace(read_flash_32=FakeReadFlash(channel))
+        self.assertTrue(compare_bin_w_device(device, self.bin_path))
+
+    def test_mismatch_returns_false(self):
+        """
+        A mismatching word returns False and leaves no replies queued.
+        """
+        self.flash[FLASH_START_ADDR + 5 * 4] ^= 1
+        channel = FakeChannel(self.flash)
+        device = SimpleNamespace(read_flash_32=FakeReadFlash(channel))
+        self.assertFalse(compare_bin_w_device(device, self.bin_path))
+        self.assertEqual(channel.queue, [])
+
+
+class TestLocalChecksum(unittest.TestCase):
+
+    def test_chunk_checksum(self):
+        """
+        The checksum of a 16 byte chunk is the 32 bit sum of its words.
+        """
+        chunk = struct.pack("<4I", 0xFFFFFFFF, 2, 3, 4)
+        self.assertEqual(calculate_local_checksum(chunk), 8)
+
+    def test_short_chunk_zero_padded(self):
+        """
+        A short trailing chunk checksums as if zero-padded.
+        """
+        chunk = b"\x01\x00\x00\x00\x02\x03"
+        self.assertEqual(calculate_local_checksum(chunk), 1 + 0x0302)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -22,6 +22,7 @@ import os
 import time
 import json
 import unittest
+import functools
 
 import yaml
 import pytest
@@ -39,6 +40,8 @@ A = ureg.ampere
 Hz = ureg.hertz
 tick = ureg.ticks
 s = ureg.second
+tick_per_s = tick / s
+tick_per_s2 = tick / (s * s)
 
 # ---------------------------------------------------------------------------
 # Helpers for YAML spec walking
@@ -46,6 +49,9 @@ s = ureg.second
 
 SPECS_DIR = str(importlib_files("tinymovr").joinpath("specs"))
 
+# Prefer the libyaml-backed loader when available, it parses much faster
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 # Attributes that have setters but should NOT have export: True.
 # Includes runtime controls and dangerous-to-import parameters.
 EXCLUDED_SETTER_PATHS = {
@@ -59,16 +65,29 @@ EXCLUDED_SETTER_PATHS = {
 RUNTIME_META_KEYS = {"jog_step"}
 
 
+@functools.lru_cache(maxsize=8)
+def _load_spec_cached(path):
+    """
+    Parse a YAML spec file once and memoize the result by path.
+    The returned dict is shared, so callers must treat it as read-only.
+    """
+    with open(path, "r") as f:
+        return yaml.load(f, Loader=Loader)
+
+
 def _walk_spec_attrs(attrs, path_prefix=""):
     """
-    Recursively yield (dotted_path, attr_dict) for every leaf attribute
-    in a YAML spec attribute tree.
+    Yield (dotted_path, attr_dict) for every leaf attribute in a YAML
+    spec attribute tree, in depth-first order. Uses an explicit stack
+    rather than recursion.
     """
-    for attr in attrs:
+    stack = [(attr, path_prefix) for attr in reversed(attrs)]
+    while stack:
+        attr, prefix = stack.pop()
         name = attr["name"]
-        dotted = f"{path_prefix}.{name}" if path_prefix else name
+        dotted = f"{prefix}.{name}" if prefix else name
         if "remote_attributes" in attr:
-            yield from _walk_spec_attrs(attr["remote_attributes"], dotted)
+            stack.extend((child, dotted) for child in reversed(attr["remote_attributes"]))
         else:
             yield dotted, attr
 
@@ -99,9 +118,8 @@ class TestSpecExportConsistency(unittest.TestCase):
     """
 
     def _load_spec(self, filename):
-        path = os.path.join(SPECS_DIR, filename)
-        with open(path, "r") as f:
-            return yaml.safe_load(f)
+        path = os.path.abspath(os.path.join(SPECS_DIR, filename))
+        return _load_spec_cached(path)
 
     def _check_spec(self, filename):
         spec = self._load_spec(filename)
@@ -145,6 +163,18 @@ class TestExportImportRoundTrip(TMTestCase):
     import, then verify the values were restored.
     """
 
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Look the optional attributes up in the spec tree rather than
+        # with hasattr(), which reads their value from the device
+        current_attrs = cls.tm.controller.current.remote_attributes
+        cls.caps = dict(
+            cls.caps,
+            Iq_limit="Iq_limit" in current_attrs,
+            max_Ibus_regen="max_Ibus_regen" in current_attrs,
+        )
+
     def test_a_export_import_round_trip(self):
         """
         Set non-default values on key attributes, export, reset, import,
@@ -173,30 +203,31 @@ class TestExportImportRoundTrip(TMTestCase):
         }
 
         # Conditionally add attrs that may exist in newer specs
-        if hasattr(self.tm.controller.current, "Iq_limit"):
+        if self.caps["Iq_limit"]:
             test_values["controller.current.Iq_limit"] = 6.0
-        if hasattr(self.tm.controller.current, "max_Ibus_regen"):
+        if self.caps["max_Ibus_regen"]:
             test_values["controller.current.max_Ibus_regen"] = 1.5
 
         # --- Set values ---
         self.tm.controller.position.p_gain = test_values["controller.position.p_gain"]
         self.tm.controller.velocity.p_gain = test_values["controller.velocity.p_gain"]
         self.tm.controller.velocity.i_gain = test_values["controller.velocity.i_gain"]
-        self.tm.controller.velocity.limit = test_values["controller.velocity.limit"] * tick / s
+        self.tm.controller.velocity.limit = test_values["controller.velocity.limit"] * tick_per_s
         self.tm.controller.velocity.deadband = test_values["controller.velocity.deadband"] * tick
         self.tm.controller.velocity.increment = test_values["controller.velocity.increment"]
         self.tm.controller.current.bandwidth = test_values["controller.current.bandwidth"]
         self.tm.controller.current.max_Ibrake = test_values["controller.current.max_Ibrake"] * A
-        self.tm.traj_planner.max_vel = test_values["traj_planner.max_vel"] * tick / s
-        self.tm.traj_planner.max_accel = test_values["traj_planner.max_accel"] * tick / s
-        self.tm.traj_planner.max_decel = test_values["traj_planner.max_decel"] * tick / (s * s)
+        self.tm.traj_planner.max_vel = test_values["traj_planner.max_vel"] * tick_per_s
+        self.tm.traj_planner.max_accel = test_values["traj_planner.max_accel"] * tick_per_s
+        self.tm.traj_planner.max_decel = test_values["traj_planner.max_decel"] * tick_per_s2
 
         if "controller.current.Iq_limit" in test_values:
             self.tm.controller.current.Iq_limit = test_values["controller.current.Iq_limit"]
         if "controller.current.max_Ibus_regen" in test_values:
             self.tm.controller.current.max_Ibus_regen = test_values["controller.current.max_Ibus_regen"]
 
-        time.sleep(0.1)
+        self.assertTrue(self.wait_until(lambda: self.tm.errors == 0),
+                        "device errors did not clear after setting values")
 
         # --- Export ---
         exported = export_config(self.tm)
@@ -238,14 +269,17 @@ class TestExportImportRoundTrip(TMTestCase):
 
         # --- Reset to defaults ---
         self.tm.controller.idle()
-        time.sleep(0.1)
+        self.assertTrue(self.wait_until(lambda: self.tm.controller.state == 0),
+                        "controller did not reach idle state")
+        # Erasing resets the device, allow it to come back up
         self.erase_config()
         time.sleep(0.2)
         self.reset_and_wait()
 
         # --- Import ---
         import_config(self.tm, reimported)
-        time.sleep(0.2)
+        self.assertTrue(self.wait_until(lambda: self.tm.errors == 0),
+                        "device errors did not clear after import")
 
         # --- Verify values restored ---
         self.assertAlmostEqual(
@@ -268,7 +302,7 @@ class TestExportImportRoundTrip(TMTestCase):
         )
         self.assertAlmostEqual(
             self.tm.controller.velocity.limit,
-            test_values["controller.velocity.limit"] * tick / s,
+            test_values["controller.velocity.limit"] * tick_per_s,
             msg="velocity limit not restored after import",
         )
         self.assertAlmostEqual(
@@ -289,12 +323,12 @@ class TestExportImportRoundTrip(TMTestCase):
         )
         self.assertAlmostEqual(
             self.tm.traj_planner.max_vel,
-            test_values["traj_planner.max_vel"] * tick / s,
+            test_values["traj_planner.max_vel"] * tick_per_s,
             msg="traj_planner max_vel not restored after import",
         )
         self.assertAlmostEqual(
             self.tm.traj_planner.max_accel,
-            test_values["traj_planner.max_accel"] * tick / s,
+            test_values["traj_planner.max_accel"] * tick_per_s,
             msg="traj_planner max_accel not restored after import",
         )
 
@@ -330,28 +364,39 @@ class TestExportCompleteness(TMTestCase):
     is accurate regardless of which firmware/spec version is running.
     """
 
-    def _collect_device_export_paths(self, node, prefix=""):
+    _export_paths = None
+
+    def _device_export_paths(self):
+        """
+        Return the export-tagged paths of the connected device, walking
+        the node tree only once per test class.
+        """
+        cls = type(self)
+        if cls._export_paths is None:
+            cls._export_paths = self._collect_device_export_paths(self.tm)
+        return cls._export_paths
+
+    def _collect_device_export_paths(self, node, keys=()):
         """
-        Walk the live Avlos node tree and collect dotted paths of all
-        attributes that have meta["export"] == True.
+        Walk the live Avlos node tree and collect (dotted_path, keys)
+        pairs of all attributes that have meta["export"] == True, where
+        keys is the dotted path pre-split into a tuple.
         """
         paths = []
         if hasattr(node, "remote_attributes"):
             for name, child in node.remote_attributes.items():
-                dotted = f"{prefix}.{name}" if prefix else name
-                paths.extend(self._collect_device_export_paths(child, dotted))
+                paths.extend(self._collect_device_export_paths(child, keys + (name,)))
         else:
             if isinstance(node, (RemoteAttribute, RemoteEnum, RemoteBitmask)):
                 if node.meta.get("export"):
-                    paths.append(prefix)
+                    paths.append((".".join(keys), keys))
         return paths
 
-    def _lookup_nested(self, data, dotted_path):
+    def _lookup_nested(self, data, keys):
         """
-        Look up a dotted path like 'controller.position.p_gain' in a
-        nested dict.  Returns (True, value) or (False, None).
+        Look up a pre-split path like ('controller', 'position', 'p_gain')
+        in a nested dict.  Returns (True, value) or (False, None).
         """
-        keys = dotted_path.split(".")
         current = data
         for key in keys:
             if not isinstance(current, dict) or key not in current:
@@ -370,13 +415,13 @@ class TestExportCompleteness(TMTestCase):
         exported = export_config(self.tm)
         self.assertIsNotNone(exported, "export_config() returned None")
 
-        expected_paths = self._collect_device_export_paths(self.tm)
+        expected_paths = self._device_export_paths()
         self.assertGreater(len(expected_paths), 0,
                            "No export-tagged attributes found on device")
 
         missing = []
-        for path in expected_paths:
-            found, _ = self._lookup_nested(exported, path)
+        for path, keys in expected_paths:
+            found, _ = self._lookup_nested(exported, keys)
             if not found:
                 missing.append(path)
 
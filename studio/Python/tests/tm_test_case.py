@@ -44,6 +44,8 @@ class TMTestCase(unittest.TestCase):
         cls.logger = configure_logging()
         init_router(can.Bus, params, logger=cls.logger)
         cls.tm = create_device(node_id=1)
+        # Optional device features, probed once per test class
+        cls.caps = {"nvm": "nvm" in cls.tm.remote_attributes}
         
         cls.reset_and_wait()
 
@@ -87,6 +89,21 @@ class TMTestCase(unittest.TestCase):
             time.sleep(check_interval)
         self.assertEqual(self.tm.controller.state, 0)
 
+    def wait_until(self, predicate, timeout=0.5, poll=0.01):
+        """Poll predicate until it returns a truthy value.
+
+        Returns:
+            The truthy result of predicate, or False if timeout elapses
+        """
+        deadline = time.perf_counter() + timeout
+        while True:
+            result = predicate()
+            if result:
+                return result
+            if time.perf_counter() >= deadline:
+                return False
+            time.sleep(poll)
+
     def check_state(self, target_state, target_error=None):
         errors = self.tm.errors
         if target_error and errors:
@@ -115,7 +132,7 @@ class TMTestCase(unittest.TestCase):
         Returns:
             Number of slots (2.4.x+) or None (2.3.x and earlier)
         """
-        if hasattr(self.tm, 'nvm'):
+        if self.caps["nvm"]:
             return self.tm.nvm.num_slots
         else:
             return None
@@ -126,7 +143,7 @@ class TMTestCase(unittest.TestCase):
         Returns:
             Current slot index (2.4.x+) or None (2.3.x and earlier)
         """
-        if hasattr(self.tm, 'nvm'):
+        if self.caps["nvm"]:
             return self.tm.nvm.current_slot
         else:
             return None
@@ -137,7 +154,7 @@ class TMTestCase(unittest.TestCase):
         Returns:
             Write count (2.4.x+) or None (2.3.x and earlier)
         """
-        if hasattr(self.tm, 'nvm'):
+        if self.caps["nvm"]:
             return self.tm.nvm.write_count
         else:
             return None
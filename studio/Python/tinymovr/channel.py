@@ -96,14 +96,21 @@ class CANChannel(BaseChannel):
         within the specified timeout, a ResponseError is raised.
         """
         with self.lock:
-            self.evt.wait(timeout=timeout)
-            self.evt.clear()
-            for frame in self.queue:
-                inc_ep_id, inc_hash, _ = ids_from_arbitration(frame.arbitration_id)
-                if inc_ep_id == ep_id and (inc_hash == self.compare_hash or inc_hash == 0):
-                    self.queue.remove(frame)
-                    return frame.data
-            raise ResponseError(self.node_id)
+            deadline = time.monotonic() + timeout
+            while True:
+                # Clear before scanning so that frames arriving during
+                # the scan still wake up the wait below. Frames already
+                # queued (e.g. responses to pipelined requests) are
+                # returned without waiting.
+                self.evt.clear()
+                for frame in self.queue:
+                    inc_ep_id, inc_hash, _ = ids_from_arbitration(frame.arbitration_id)
+                    if inc_ep_id == ep_id and (inc_hash == self.compare_hash or inc_hash == 0):
+                        self.queue.remove(frame)
+                        return frame.data
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.evt.wait(timeout=remaining):
+                    raise ResponseError(self.node_id)
 
     def create_frame(self, endpoint_id, rtr=False, payload=None):
         """
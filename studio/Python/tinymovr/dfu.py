@@ -16,13 +16,10 @@ Options:
 import sys
 import os
 import time
-import inspect
+import struct
+from contextlib import closing
 from pathlib import Path
 import can
-import yaml
-from rich.progress import Progress
-import IPython
-from traitlets.config import Config
 from docopt import docopt
 from tinymovr.bus_router import init_router, destroy_router
 from tinymovr.config import get_bus_config, create_device, configure_logging
@@ -47,44 +44,167 @@ this program. If not, see <http://www.gnu.org/licenses/>.
 
 # Define constants
 BIN_CHUNK_SIZE = 4
+# The scratchpad writes below are unrolled for exactly four words
+assert BIN_CHUNK_SIZE == 4
 FLASH_START_ADDR = 0x00001000
 
 # NVM config region: pages 120-127 (8 KB at end of flash)
 NVM_START_ADDR = 0x0001E000
 NVM_SIZE = 8 * 1024
+NVM_PAGE_SIZE = 256
+
+# Erased flash sentinels
+_FF_CHUNK = b"\xff" * (BIN_CHUNK_SIZE * 4)
+_FF_PAGE = b"\xff" * NVM_PAGE_SIZE
+
+# Unpacks one scratchpad chunk into its 32 bit words
+_WORD4 = struct.Struct("<{}I".format(BIN_CHUNK_SIZE))
+# Packs one NVM page worth of 32 bit words
+_PAGE_WORDS = struct.Struct("<{}I".format(NVM_PAGE_SIZE // 4))
+
+# Pause after filling the scratchpad, before committing it (seconds).
+# Applied once per chunk, as sub-millisecond sleeps are rounded up to
+# the OS scheduler granularity and dominated upload time per word.
+SCRATCH_WRITE_DELAY = 4e-5
+
+# Progress bars are advanced in steps of this many bytes, as every
+# update may trigger a re-render
+PROGRESS_UPDATE_BYTES = 1024
+
+# Number of flash read requests sent back-to-back. Kept to the size of
+# the scratchpad burst (four write_scratch_32 frames plus commit) that
+# the bootloader already receives during upload_bin.
+READ_BLOCK_WORDS = 4
+
+
+def _read_flash_window(func, addr, n_words):
+    """
+    Send n_words read_flash_32 requests back-to-back and collect their
+    replies. Raises ResponseError if any reply does not arrive. If reading
+    stops for any other reason, replies still in flight are collected and
+    discarded, so that they are not mistaken for replies to later reads.
+    """
+    channel = func.channel
+    serializer = channel.serializer
+    arg_dtypes = [arg.dtype for arg in func.arguments]
+    for i in range(n_words):
+        data = serializer.serialize([addr + i * 4], *arg_dtypes)
+        channel.send(data, func.ep_id)
+    words = []
+    try:
+        for _ in range(n_words):
+            value, *_ = serializer.deserialize(channel.recv(func.ep_id), func.dtype)
+            words.append(value)
+    except ResponseError:
+        # Every reply that arrived has been consumed, nothing to discard
+        raise
+    except BaseException:
+        for _ in range(n_words - len(words)):
+            try:
+                channel.recv(func.ep_id)
+            except ResponseError:
+                # The remaining replies were lost, nothing left to discard
+                break
+        raise
+    return words
+
+
+def iter_flash_words(device, addr, n_words):
+    """
+    Yield n_words consecutive 32 bit words from flash, starting at addr.
+    Read requests are sent in windows of READ_BLOCK_WORDS, so that the
+    bus round-trip is paid once per window rather than once per word.
+
+    Replies carry no address, so a dropped request or reply would shift
+    every later value in its window. Each window is therefore collected
+    in full before any of it is yielded. If a window fails, it and the
+    remaining words are read sequentially with read_flash_32. Sequential
+    reads are also used if the endpoint does not expose its channel.
+    """
+    func = device.read_flash_32
+    done = 0
+    if getattr(func, "channel", None) is not None:
+        try:
+            while done < n_words:
+                count = min(READ_BLOCK_WORDS, n_words - done)
+                words = _read_flash_window(func, addr + done * 4, count)
+                for value in words:
+                    done += 1
+                    yield value
+        except ResponseError:
+            pass
+    for i in range(done, n_words):
+        yield func(addr + i * 4)
+
+
+def read_flash_block(device, addr, n_words):
+    """
+    Read n_words consecutive 32 bit words from flash, starting at addr,
+    and return them as a list. See iter_flash_words().
+    """
+    return list(iter_flash_words(device, addr, n_words))
+
+
+def _read_bin_words(bin_path):
+    """
+    Read a .bin file into memory in one go and return it as a tuple of
+    little-endian 32 bit words, zero-padded to whole scratchpad chunks.
+    """
+    bin_data = Path(bin_path).read_bytes()
+    chunk_size = BIN_CHUNK_SIZE * 4
+    if len(bin_data) % chunk_size:
+        bin_data += bytes(chunk_size - len(bin_data) % chunk_size)
+    # Compile an unpacker for the exact image size and decode it in one call
+    unpacker = struct.Struct(f"<{len(bin_data) // 4}I")
+    return unpacker.unpack(bin_data)
+
+
+def _iter_bin_words(bin_path, n_words=BIN_CHUNK_SIZE):
+    """
+    Yield (flash_addr, words) pairs from a .bin file, each holding
+    n_words 32 bit words. See _read_bin_words().
+    """
+    words = _read_bin_words(bin_path)
+    for base in range(0, len(words), n_words):
+        yield FLASH_START_ADDR + base * 4, words[base : base + n_words]
 
 
 def compare_bin_w_device(device, bin_path, string="Comparing"):
     """
     Compare .bin file and device non-volatile memory
     """
+    from rich.progress import Progress
+
     with Progress() as progress:
         total_size = os.path.getsize(bin_path)
         task1 = progress.add_task("[green]{}...".format(string), total=total_size)
 
-        with open(bin_path, "rb") as bin_file:
-            chunk = bin_file.read(BIN_CHUNK_SIZE * 4)
-            flash_addr = FLASH_START_ADDR
-            while chunk:
-                for i in range(BIN_CHUNK_SIZE):
-                    file_value = int.from_bytes(
-                        chunk[i * 4 : (i + 1) * 4], byteorder="little"
-                    )
-                    device_value = device.read_flash_32(flash_addr + i * 4)
-                    if file_value != device_value:
-                        return False
-                chunk = bin_file.read(BIN_CHUNK_SIZE * 4)
-                flash_addr += BIN_CHUNK_SIZE * 4
-                progress.update(task1, advance=BIN_CHUNK_SIZE * 4)
+        file_words = _read_bin_words(bin_path)
+        device_words = iter_flash_words(device, FLASH_START_ADDR, len(file_words))
+        pending = 0
+        # Closing the reader on a mismatch stops requesting further words
+        with closing(device_words):
+            for file_value, device_value in zip(file_words, device_words):
+                if file_value != device_value:
+                    return False
+                pending += 4
+                if pending >= PROGRESS_UPDATE_BYTES:
+                    progress.update(task1, advance=pending)
+                    pending = 0
+        progress.update(task1, advance=pending)
     return True
 
 
 def calculate_local_checksum(chunk):
     """Calculate the checksum for a chunk of data"""
-    checksum = sum(
-        int.from_bytes(chunk[i * 4 : (i + 1) * 4], byteorder="little")
-        for i in range(BIN_CHUNK_SIZE)
-    )
+    # Zero-pad a short trailing chunk to a whole scratchpad
+    return _checksum_words(_WORD4.unpack(chunk.ljust(_WORD4.size, b"\x00")))
+
+
+def _checksum_words(words):
+    """Calculate the checksum for a chunk of 32 bit words"""
+    w0, w1, w2, w3 = words
+    checksum = w0 + w1 + w2 + w3
     return checksum & 0xFFFFFFFF  # To ensure we get a 32-bit value
 
 
@@ -93,17 +213,23 @@ def read_nvm_region(device):
     Read the NVM config region from flash before erasing.
     Returns the region as bytes, or None if it is entirely erased (0xFF).
     """
+    from rich.progress import Progress
+
     print("Backing up NVM config region...")
-    data = bytearray()
-    word_count = NVM_SIZE // 4
+    data = bytearray(NVM_SIZE)
+    page_words = NVM_PAGE_SIZE // 4
+    erased = True
     with Progress() as progress:
-        task = progress.add_task("[cyan]Reading NVM...", total=word_count)
-        for i in range(word_count):
-            value = device.read_flash_32(NVM_START_ADDR + i * 4)
-            data.extend(value.to_bytes(4, byteorder="little"))
-            progress.update(task, advance=1)
-
-    if all(b == 0xFF for b in data):
+        task = progress.add_task("[cyan]Reading NVM...", total=NVM_SIZE // 4)
+        for offset in range(0, NVM_SIZE, NVM_PAGE_SIZE):
+            words = read_flash_block(device, NVM_START_ADDR + offset, page_words)
+            _PAGE_WORDS.pack_into(data, offset, *words)
+            # Stop checking for erased pages once a programmed one is seen
+            if erased and not data.startswith(_FF_PAGE, offset):
+                erased = False
+            progress.update(task, advance=page_words)
+
+    if erased:
         print("NVM region is empty, nothing to preserve.")
         return None
 
@@ -116,37 +242,37 @@ def write_nvm_region(device, data):
     Write a previously backed-up NVM config region back to flash.
     Uses the scratchpad + commit mechanism (16 bytes per commit).
     """
+    from rich.progress import Progress
+
     if data is None:
         return
 
     print("Restoring NVM config region...")
     chunk_size = BIN_CHUNK_SIZE * 4  # 16 bytes per commit
-    num_chunks = NVM_SIZE // chunk_size
     with Progress() as progress:
-        task = progress.add_task("[cyan]Writing NVM...", total=num_chunks)
-        for chunk_idx in range(num_chunks):
-            offset = chunk_idx * chunk_size
-            chunk = data[offset : offset + chunk_size]
-
+        task = progress.add_task("[cyan]Writing NVM...", total=NVM_SIZE)
+        pending = 0
+        for offset in range(0, NVM_SIZE, chunk_size):
             # Skip chunks that are all 0xFF (already erased)
-            if all(b == 0xFF for b in chunk):
-                progress.update(task, advance=1)
-                continue
-
-            for i in range(BIN_CHUNK_SIZE):
-                value = int.from_bytes(
-                    chunk[i * 4 : (i + 1) * 4], byteorder="little"
-                )
-                device.write_scratch_32(i, value)
-                time.sleep(1e-5)
-
-            flash_addr = NVM_START_ADDR + offset
-            try:
-                device.commit(flash_addr, device.hash_uint32)
-            except TypeError:
-                device.commit(flash_addr)
+            if not data.startswith(_FF_CHUNK, offset):
+                w0, w1, w2, w3 = _WORD4.unpack_from(data, offset)
+                device.write_scratch_32(0, w0)
+                device.write_scratch_32(1, w1)
+                device.write_scratch_32(2, w2)
+                device.write_scratch_32(3, w3)
+                time.sleep(SCRATCH_WRITE_DELAY)
+
+                flash_addr = NVM_START_ADDR + offset
+                try:
+                    device.commit(flash_addr, device.hash_uint32)
+                except TypeError:
+                    device.commit(flash_addr)
 
-            progress.update(task, advance=1)
+            pending += chunk_size
+            if pending >= PROGRESS_UPDATE_BYTES:
+                progress.update(task, advance=pending)
+                pending = 0
+        progress.update(task, advance=pending)
 
     print("NVM config region restored.")
 
@@ -155,6 +281,8 @@ def upload_bin(device, bin_path):
     """
     Upload a binary file to the device, preserving the NVM config region.
     """
+    from rich.progress import Progress
+
     total_size = os.path.getsize(bin_path)
 
     # Back up NVM config region before erasing
@@ -172,31 +300,31 @@ def upload_bin(device, bin_path):
     
     with Progress() as progress:
         task2 = progress.add_task("[orange]Flashing...", total=total_size)
-        with open(bin_path, "rb") as bin_file:
-            chunk = bin_file.read(BIN_CHUNK_SIZE * 4)
-            flash_addr = FLASH_START_ADDR
-            while chunk:
-                for i in range(BIN_CHUNK_SIZE):
-                    value = int.from_bytes(
-                        chunk[i * 4 : (i + 1) * 4], byteorder="little"
-                    )
-                    device.write_scratch_32(i, value)
-                    time.sleep(1e-5)
+        pending = 0
+        for flash_addr, words in _iter_bin_words(bin_path):
+            w0, w1, w2, w3 = words
+            device.write_scratch_32(0, w0)
+            device.write_scratch_32(1, w1)
+            device.write_scratch_32(2, w2)
+            device.write_scratch_32(3, w3)
+            time.sleep(SCRATCH_WRITE_DELAY)
 
-                try:
-                    device_checksum = device.commit(flash_addr, device.hash_uint32)
-                except TypeError:
-                    device_checksum = device.commit(flash_addr)
+            try:
+                device_checksum = device.commit(flash_addr, device.hash_uint32)
+            except TypeError:
+                device_checksum = device.commit(flash_addr)
 
-                local_checksum = calculate_local_checksum(chunk)
+            local_checksum = _checksum_words(words)
 
-                if device_checksum != local_checksum:
-                    print(f"Checksum mismatch at address {flash_addr:08X}. Exiting...")
-                    sys.exit(1)
+            if device_checksum != local_checksum:
+                print(f"Checksum mismatch at address {flash_addr:08X}. Exiting...")
+                sys.exit(1)
 
-                chunk = bin_file.read(BIN_CHUNK_SIZE * 4)
-                flash_addr += BIN_CHUNK_SIZE * 4
-                progress.update(task2, advance=BIN_CHUNK_SIZE * 4)
+            pending += BIN_CHUNK_SIZE * 4
+            if pending >= PROGRESS_UPDATE_BYTES:
+                progress.update(task2, advance=pending)
+                pending = 0
+        progress.update(task2, advance=pending)
 
     # Restore NVM config region after firmware write
     write_nvm_region(device, nvm_data)